@@ -1,70 +1,331 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import AwareDatetime, BaseModel, ConfigDict
 from livekit.api import LiveKitAPI, CreateRoomRequest
 from livekit import api
+import aiohttp
+import asyncio
+import itertools
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
 import time
-import json
-import os
-import uuid
+import weakref
+from cachetools import TTLCache
+import orjson
 from datetime import datetime, timezone
-from dotenv import load_dotenv
-import requests
+import httpx
 
-load_dotenv()
+from config import settings
 
-app = FastAPI()
+# Handlers are attached in lifespan, so importing this module twice doesn't stack them
+logger = logging.getLogger("call")
+logger.setLevel(logging.INFO)
+logger.propagate = False
 
-# LiveKit configuration
-api_key = os.getenv("LIVEKIT_API_KEY")
-api_secret = os.getenv("LIVEKIT_API_SECRET")
-livekit_url = os.getenv("LIVEKIT_URL", "http://localhost:7880")
+# Call script passed to the agent
+script_path = "script.txt"
 
-# Waalaxy configuration
-waalaxy_username = os.getenv("WAALAXY_USERNAME")
-waalaxy_password = os.getenv("WAALAXY_PASSWORD")
-waalaxy_api_url = os.getenv("WAALAXY_API_URL", "https://api.waalaxy.com/api")
+# Characters dropped from phone numbers when building room names
+_PHONE_TRANS = str.maketrans("", "", "+ -")
+
+# Per-process sequence that keeps room names unique within the same nanosecond
+_room_counter = itertools.count()
 
 class CallRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True, str_strip_whitespace=True)
+
     user_name: str
     phone_number: str
 
+class BulkCallRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
+    contacts: list[CallRequest]
+
+class ScheduledContact(CallRequest):
+    linkedin_url: str | None = None  # Kept with the schedule for the post-call follow-up
+
+class ScheduleBulkCallsRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
+    contacts: list[ScheduledContact]
+    scheduled_at: AwareDatetime  # Must carry a UTC offset; naive times are rejected
+
 class LinkedInMessageRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True, str_strip_whitespace=True)
+
     linkedin_profile_url: str
     message_content: str
     call_reference: str  # Reference to the call (room_name or dispatch_id)
     user_name: str
 
-@app.post("/initiate_call")
-async def initiate_call(request: CallRequest):
+class BulkLinkedInMessageRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
+    messages: list[LinkedInMessageRequest]
+
+async def warm_up_livekit(lkapi: LiveKitAPI):
     """
-    Initiate an outbound call with user name and phone number
+    Open the LiveKit connection ahead of the first call so it skips the handshake
+    """
+    try:
+        await lkapi.room.list_rooms(api.ListRoomsRequest())
+    except Exception as e:
+        logger.warning(f"LiveKit warm-up failed: {e}")
+
+async def get_waalaxy_token(app: FastAPI, stale_token: str = None) -> str:
+    """
+    Return the cached Waalaxy session token, logging in again once it expires.
+    Pass stale_token after a 401 to force a fresh login for that token.
+    """
+    async with app.state.waalaxy_lock:
+        token = app.state.waalaxy_token
+        if token and token != stale_token and time.monotonic() < app.state.waalaxy_token_expiry:
+            return token
+
+        auth_payload = {
+            "username": settings.waalaxy_username,
+            "password": settings.waalaxy_password
+        }
+        auth_response = await app.state.http.post(
+            f"{settings.waalaxy_api_url}/auth/login",
+            json=auth_payload
+        )
+
+        if auth_response.status_code != 200:
+            raise HTTPException(
+                status_code=auth_response.status_code,
+                detail=f"Waalaxy authentication failed: {auth_response.text}"
+            )
+
+        # Extract session cookie or token from response
+        app.state.waalaxy_token = auth_response.json().get("token", "")
+        app.state.waalaxy_token_expiry = time.monotonic() + settings.waalaxy_token_ttl
+        return app.state.waalaxy_token
+
+async def warm_up_waalaxy(app: FastAPI):
+    """
+    Log in to Waalaxy ahead of the first LinkedIn message
     """
-    if not api_key or not api_secret:
+    try:
+        await get_waalaxy_token(app)
+    except Exception as e:
+        logger.warning(f"Waalaxy warm-up failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Create shared outbound clients on startup and close them on shutdown
+    """
+    # Request handlers only enqueue log records; a background thread writes them out
+    log_queue = queue.Queue(-1)
+    log_handler = QueueHandler(log_queue)
+    log_listener = QueueListener(log_queue, logging.StreamHandler())
+    logger.addHandler(log_handler)
+    log_listener.start()
+    app.state.http = httpx.AsyncClient(
+        timeout=30,
+        limits=httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry
+        )
+    )
+    # LiveKitAPI runs on aiohttp, so give it a session sized the same way
+    app.state.livekit_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=settings.http_max_connections,
+            keepalive_timeout=settings.http_keepalive_expiry
+        ),
+        timeout=aiohttp.ClientTimeout(total=60)
+    )
+    # LiveKitAPI refuses to build without credentials; initiate_call reports that case
+    app.state.lkapi = None
+    if settings.livekit_api_key and settings.livekit_api_secret:
+        app.state.lkapi = LiveKitAPI(
+            url=settings.livekit_url,
+            api_key=settings.livekit_api_key,
+            api_secret=settings.livekit_api_secret,
+            session=app.state.livekit_session
+        )
+    app.state.linkedin_sem = asyncio.Semaphore(settings.linkedin_max_concurrency)
+    app.state.waalaxy_lock = asyncio.Lock()
+    # Recently sent LinkedIn messages, so duplicate requests don't message a profile twice
+    app.state.linkedin_sent = TTLCache(maxsize=10_000, ttl=settings.linkedin_dedup_ttl)
+    app.state.linkedin_locks = weakref.WeakValueDictionary()
+    app.state.waalaxy_token = None
+    app.state.waalaxy_token_expiry = 0.0
+    # Read the call script once instead of on every call
+    with open(script_path, "r") as script_file:
+        app.state.script = script_file.read()
+    # Warm up in the background so startup is not held up by the network
+    warm_ups = []
+    if app.state.lkapi is not None:
+        warm_ups.append(asyncio.create_task(warm_up_livekit(app.state.lkapi)))
+    if settings.waalaxy_username and settings.waalaxy_password:
+        warm_ups.append(asyncio.create_task(warm_up_waalaxy(app)))
+    # Pending /schedule_bulk_calls jobs by schedule id
+    app.state.scheduled_calls = {}
+    try:
+        yield
+    finally:
+        for task in [*warm_ups, *app.state.scheduled_calls.values()]:
+            task.cancel()
+        if app.state.lkapi is not None:
+            await app.state.lkapi.aclose()
+        # LiveKitAPI leaves a caller-supplied session open
+        await app.state.livekit_session.close()
+        await app.state.http.aclose()
+        # Drains what is still queued before the handler goes away
+        log_listener.stop()
+        logger.removeHandler(log_handler)
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+
+def require_livekit():
+    """
+    Reject call endpoints up front when LiveKit credentials are missing
+    """
+    if not settings.livekit_api_key or not settings.livekit_api_secret:
         raise HTTPException(
-            status_code=500, 
+            status_code=500,
             detail="LiveKit API credentials not configured"
         )
-    
-    lkapi = LiveKitAPI(url=livekit_url, api_key=api_key, api_secret=api_secret)
-    
-    try:
-        # Read the script from the file
-        script_path = "script.txt"
-        with open(script_path, "r") as script_file:
-            script_content = script_file.read()
-
-        # Prepare metadata for the agent
-        metadata_dict = {
-            "phone_number": request.phone_number,
-            "transfer_to": None,  # No transfer needed for demo
-            "user_name": request.user_name,
-            "script": script_content  # Pass the script content
+
+def require_waalaxy():
+    """
+    Reject LinkedIn endpoints up front when Waalaxy credentials are missing
+    """
+    if not settings.waalaxy_username or not settings.waalaxy_password:
+        raise HTTPException(
+            status_code=500,
+            detail="Waalaxy credentials not configured"
+        )
+
+@app.post("/initiate_call", dependencies=[Depends(require_livekit)])
+async def initiate_call(request: CallRequest, http_request: Request):
+    """
+    Initiate an outbound call with user name and phone number
+    """
+    return await dispatch_call(http_request.app, request)
+
+@app.post("/initiate_calls_bulk", dependencies=[Depends(require_livekit)])
+async def initiate_calls_bulk(request: BulkCallRequest, http_request: Request):
+    """
+    Initiate calls for a list of contacts, streaming one NDJSON status line per
+    contact as soon as its dispatch finishes
+    """
+    async def stream():
+        statuses = dispatch_calls(http_request.app, request.contacts)
+        try:
+            async for status in statuses:
+                yield orjson.dumps(status) + b"\n"
+        finally:
+            # Client went away mid-stream; don't keep dialing
+            await statuses.aclose()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.post("/schedule_bulk_calls", dependencies=[Depends(require_livekit)])
+async def schedule_bulk_calls(request: ScheduleBulkCallsRequest, http_request: Request):
+    """
+    Schedule calls for a list of contacts; the backend dials them at scheduled_at.
+    Schedules are held in memory and do not survive a restart.
+    """
+    delay = request.scheduled_at.timestamp() - time.time()
+    if delay <= 0:
+        # Dialing a whole list immediately is never what a past schedule meant
+        raise HTTPException(
+            status_code=422,
+            detail="scheduled_at must be in the future"
+        )
+
+    app = http_request.app
+    schedule_id = f"schedule-{time.time_ns()}-{next(_room_counter):x}"
+
+    task = asyncio.create_task(run_scheduled_calls(app, schedule_id, request.contacts, delay))
+    app.state.scheduled_calls[schedule_id] = task
+    task.add_done_callback(lambda _: app.state.scheduled_calls.pop(schedule_id, None))
+
+    return {
+        "status": "success",
+        "schedule_id": schedule_id,
+        "scheduled_calls": len(request.contacts),
+        "scheduled_at": request.scheduled_at.isoformat()
+    }
+
+async def run_scheduled_calls(app: FastAPI, schedule_id: str, contacts: list[ScheduledContact], delay: float):
+    """
+    Wait until a schedule is due, then dispatch all of its calls
+    """
+    await asyncio.sleep(delay)
+    logger.info(f"{schedule_id}: dialing {len(contacts)} contacts")
+
+    failed = 0
+    async for status in dispatch_calls(app, contacts):
+        if not status["ok"]:
+            failed += 1
+            logger.warning(f"{schedule_id}: call to {status['user_name']} failed: {status['detail']}")
+            continue
+        # The room name is the call_reference a LinkedIn follow-up for this contact needs
+        linkedin_url = contacts[status["index"]].linkedin_url
+        if linkedin_url:
+            logger.info(f"{schedule_id}: {status['call_details']['room_name']} -> {linkedin_url}")
+    logger.info(f"{schedule_id}: done, {len(contacts) - failed} initiated, {failed} failed")
+
+async def dispatch_calls(app: FastAPI, contacts: list[CallRequest]):
+    """
+    Dispatch calls concurrently (bounded by BULK_CALL_CONCURRENCY), yielding a
+    status dict per contact as each one finishes
+    """
+    limit = asyncio.Semaphore(settings.bulk_call_concurrency)
+
+    async def dispatch(index: int, contact: CallRequest) -> dict:
+        async with limit:
+            try:
+                result = await dispatch_call(app, contact)
+                status = {"ok": True, "call_details": result["call_details"]}
+            except HTTPException as e:
+                status = {"ok": False, "detail": e.detail}
+        return {
+            "index": index,
+            "user_name": contact.user_name,
+            "phone_number": contact.phone_number,
+            **status
         }
-        metadata = json.dumps(metadata_dict)
 
-        # Create a room with unique name
-        room_name = f"call-{int(time.time())}-{request.phone_number.replace('+', '').replace(' ', '')}-{uuid.uuid4().hex[:8]}"
-        
+    tasks = [asyncio.create_task(dispatch(i, c)) for i, c in enumerate(contacts)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def dispatch_call(app: FastAPI, request: CallRequest) -> dict:
+    """
+    Create the LiveKit room and agent dispatch for one call
+    """
+    lkapi = app.state.lkapi
+    script_content = app.state.script
+
+    # Prepare metadata for the agent
+    metadata_dict = {
+        "phone_number": request.phone_number,
+        "transfer_to": None,  # No transfer needed for demo
+        "user_name": request.user_name,
+        "script": script_content  # Pass the script content
+    }
+    metadata = orjson.dumps(metadata_dict).decode()
+
+    # Unique room name for this call
+    room_name = f"call-{time.time_ns()}-{next(_room_counter):x}-{request.phone_number.translate(_PHONE_TRANS)}"
+
+    try:
+        # The room must exist before dispatch: a dispatch to a missing room creates it
+        # with server defaults, which would race the timeout/participant settings below
         room = await lkapi.room.create_room(CreateRoomRequest(
             name=room_name,
             empty_timeout=10 * 60,  # 10 minutes
@@ -98,72 +359,61 @@ async def initiate_call(request: CallRequest):
             status_code=500,
             detail=f"Failed to initiate call: {str(e)}"
         )
-    
-    finally:
-        await lkapi.aclose()
 
-@app.post("/send_linkedin_message")
-async def send_linkedin_message(request: LinkedInMessageRequest):
+async def deliver_linkedin_message(app: FastAPI, request: LinkedInMessageRequest) -> dict:
     """
-    Send a follow-up LinkedIn message to a prospect after a call
+    Send one follow-up through Waalaxy, answering repeats of a recent message from cache
     """
-    if not waalaxy_username or not waalaxy_password:
-        raise HTTPException(
-            status_code=500,
-            detail="Waalaxy credentials not configured"
-        )
-    
-    try:
-        # First, authenticate with Waalaxy
-        auth_payload = {
-            "username": waalaxy_username,
-            "password": waalaxy_password
-        }
-        
-        auth_response = requests.post(
-            f"{waalaxy_api_url}/auth/login",
-            json=auth_payload
-        )
-        
-        if auth_response.status_code != 200:
-            raise HTTPException(
-                status_code=auth_response.status_code,
-                detail=f"Waalaxy authentication failed: {auth_response.text}"
-            )
-        
-        # Extract session cookie or token from response
-        session_data = auth_response.json()
-        session_token = session_data.get("token", "")
+    message = request.message_content.format(
+        user_name=request.user_name,
+        call_reference=request.call_reference
+    )
+    key = (request.linkedin_profile_url, message)
+    sent = app.state.linkedin_sent
+    if key in sent:
+        return sent[key]
+
+    # Concurrent duplicates wait here and then find the first one's result in the cache
+    lock = app.state.linkedin_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        if key in sent:
+            return sent[key]
+
+        # Reuse the Waalaxy session instead of logging in for every message
+        http = app.state.http
+        session_token = await get_waalaxy_token(app)
 
         # Prepare the message request for Waalaxy API
         waalaxy_payload = {
             "profileUrl": request.linkedin_profile_url,
-            "message": request.message_content.format(
-                user_name=request.user_name,
-                call_reference=request.call_reference
-            ),
+            "message": message,
             "campaign": "Cold Call Follow-up"
         }
-        
-        # Send the message using Waalaxy API
-        headers = {
-            "Cookie": f"session={session_token}",  # Or use appropriate header based on Waalaxy docs
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.post(
-            f"{waalaxy_api_url}/messages/send",
-            json=waalaxy_payload,
-            headers=headers
-        )
-        
+
+        # Gate sends so concurrent requests don't pile onto the one LinkedIn account
+        async with app.state.linkedin_sem:
+            # Send the message using Waalaxy API, logging in again once if the session expired
+            for attempt in range(2):
+                headers = {
+                    "Cookie": f"session={session_token}",  # Or use appropriate header based on Waalaxy docs
+                    "Content-Type": "application/json"
+                }
+                response = await http.post(
+                    f"{settings.waalaxy_api_url}/messages/send",
+                    json=waalaxy_payload,
+                    headers=headers
+                )
+                if response.status_code != 401 or attempt:
+                    break
+                session_token = await get_waalaxy_token(app, stale_token=session_token)
+
         if response.status_code != 200:
             raise HTTPException(
                 status_code=response.status_code,
                 detail=f"Waalaxy API error: {response.text}"
             )
-        
-        return {
+
+        result = {
             "message": "LinkedIn follow-up message sent successfully",
             "details": {
                 "linkedin_profile": request.linkedin_profile_url,
@@ -172,6 +422,16 @@ async def send_linkedin_message(request: LinkedInMessageRequest):
                 "timestamp": datetime.now(timezone.utc).isoformat()
             }
         }
+        sent[key] = result
+        return result
+
+@app.post("/send_linkedin_message", dependencies=[Depends(require_waalaxy)])
+async def send_linkedin_message(request: LinkedInMessageRequest, http_request: Request):
+    """
+    Send a follow-up LinkedIn message to a prospect after a call
+    """
+    try:
+        return await deliver_linkedin_message(http_request.app, request)
         
     except Exception as e:
         raise HTTPException(
@@ -179,10 +439,51 @@ async def send_linkedin_message(request: LinkedInMessageRequest):
             detail=f"Failed to send LinkedIn message: {str(e)}"
         )
 
+@app.post("/send_linkedin_messages_bulk", dependencies=[Depends(require_waalaxy)])
+async def send_linkedin_messages_bulk(request: BulkLinkedInMessageRequest, http_request: Request):
+    """
+    Send follow-up LinkedIn messages to several prospects in one request, sharing
+    one Waalaxy session; results come back in request order
+    """
+    app = http_request.app
+
+    async def deliver(index: int, message: LinkedInMessageRequest) -> dict:
+        try:
+            result = await deliver_linkedin_message(app, message)
+            status = {"ok": True, "details": result["details"]}
+        except Exception as e:
+            status = {"ok": False, "detail": getattr(e, "detail", str(e))}
+        return {
+            "index": index,
+            "linkedin_profile": message.linkedin_profile_url,
+            "user_name": message.user_name,
+            **status
+        }
+
+    # Sends are still gated by LINKEDIN_MAX_CONCURRENCY inside deliver_linkedin_message
+    results = await asyncio.gather(*(deliver(i, m) for i, m in enumerate(request.messages)))
+    sent = sum(result["ok"] for result in results)
+    return {
+        "status": "success" if sent == len(results) else "partial",
+        "sent": sent,
+        "failed": len(results) - sent,
+        "results": results
+    }
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # "auto" resolves to uvloop where it is installed (it has no Windows build).
+    # Worker processes need the import string; a single process serves this
+    # module's app directly instead of importing the file a second time as "call"
+    uvicorn.run(
+        app if settings.web_concurrency == 1 else "call:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="auto",
+        http="httptools",
+        workers=settings.web_concurrency
+    )
\ No newline at end of file
@@ -0,0 +1,40 @@
+import functools
+import os
+from types import SimpleNamespace
+from dotenv import load_dotenv
+
+@functools.lru_cache(maxsize=1)
+def get_settings():
+    """
+    Load .env once and return a snapshot of the settings used across the app
+    """
+    load_dotenv()
+    return SimpleNamespace(
+        # LiveKit configuration
+        livekit_api_key=os.getenv("LIVEKIT_API_KEY"),
+        livekit_api_secret=os.getenv("LIVEKIT_API_SECRET"),
+        livekit_url=os.getenv("LIVEKIT_URL", "http://localhost:7880"),
+        sip_outbound_trunk_id=os.getenv("SIP_OUTBOUND_TRUNK_ID"),
+        google_api_key=os.getenv("GOOGLE_API_KEY"),
+        # Waalaxy configuration
+        waalaxy_username=os.getenv("WAALAXY_USERNAME"),
+        waalaxy_password=os.getenv("WAALAXY_PASSWORD"),
+        waalaxy_api_url=os.getenv("WAALAXY_API_URL", "https://api.waalaxy.com/api"),
+        # Seconds a Waalaxy session token is reused before logging in again
+        waalaxy_token_ttl=float(os.getenv("WAALAXY_TOKEN_TTL", "3600")),
+        # Max LiveKit dispatches in flight for one /initiate_calls_bulk request
+        bulk_call_concurrency=int(os.getenv("BULK_CALL_CONCURRENCY", "16")),
+        # Max LinkedIn messages sent at once through the shared account
+        linkedin_max_concurrency=int(os.getenv("LINKEDIN_MAX_CONCURRENCY", "1")),
+        # Seconds a repeat of the same message to the same profile is answered from cache
+        linkedin_dedup_ttl=float(os.getenv("LINKEDIN_DEDUP_TTL", "3600")),
+        # Connection pool sizing for outbound HTTP (LiveKit and Waalaxy)
+        http_max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "200")),
+        http_max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "50")),
+        # Kept below typical firewall/NAT idle timeouts so pooled sockets aren't silently dropped
+        http_keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "25")),
+        # Uvicorn worker processes; each one holds its own clients and LinkedIn limit
+        web_concurrency=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
+
+settings = get_settings()
\ No newline at end of file
@@ -1,9 +1,14 @@
 import streamlit as st
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import orjson
 from datetime import datetime
 import pandas as pd
 import io
+import re
 
 # Configure Streamlit page
 st.set_page_config(
@@ -15,6 +20,74 @@ st.set_page_config(
 # Backend API URL
 API_BASE_URL = "http://localhost:8000"
 
+# Columns every contacts CSV must have
+REQUIRED_COLUMNS = ['name', 'phone']
+
+# Columns read from a contacts CSV; anything else in the file is ignored
+CONTACT_COLUMNS = {'name', 'phone', 'linkedin_url', 'industry', 'company'}
+
+# Rows parsed at a time from an uploaded CSV
+CSV_CHUNK_ROWS = 50_000
+# Anything that isn't a digit is formatting noise in a phone cell; '+' is re-added in front
+_PHONE_JUNK = re.compile(r'\D')
+# Phone columns that went through a spreadsheet as numbers ("14155552671.0", "1.23E+10");
+# their digits can't be recovered reliably, so these cells count as missing
+_PHONE_AS_FLOAT = re.compile(r'\s*\+?\d+(\.\d+)?[eE][+-]?\d+\s*|\s*\+?\d+\.0+\s*')
+# Numbers with an extension ("ext 12", "x12", "#12") can't be dialed as one number,
+# and gluing the extension digits on would give a different valid-looking number
+_PHONE_EXTENSION = re.compile(r'(?:ext\.?|x|#)\s*\d+\s*$', re.IGNORECASE)
+# Trunk prefix written in parentheses, as in "+44 (0)20 7946 0958"; never dialed after a country code
+_PHONE_TRUNK_ZERO = re.compile(r'\(\s*0\s*\)')
+
+# Request bodies are pre-encoded with orjson, so the content type is set by hand
+JSON_HEADERS = {"content-type": "application/json"}
+
+# Rows rendered in the contact preview table
+PREVIEW_ROWS = 200
+
+# (connect, read) timeouts; the bulk read timeout bounds the gap between streamed results
+CALL_TIMEOUT = (3.05, 8)
+BULK_CALL_TIMEOUT = (3.05, 30)
+
+# Concurrent backend requests when calling a CSV selection (kept below the session pool size)
+BULK_CALL_WORKERS = 8
+
+@st.cache_resource
+def get_session():
+    """
+    Shared HTTP session so calls to the backend reuse pooled keep-alive connections
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=32,
+        # Once retries run out, hand back the last 5xx response instead of raising
+        # RetryError, so callers can report the backend's status and detail
+        max_retries=Retry(
+            total=2,
+            backoff_factor=0.2,
+            status_forcelist=[502, 503, 504],
+            raise_on_status=False
+        )
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_data(ttl=10, show_spinner=False)
+def _backend_health() -> tuple[bool, str]:
+    """
+    Probe the backend /health endpoint, cached briefly so reruns don't re-hit it.
+    Returns (ok, detail) where detail explains a failed probe.
+    """
+    try:
+        response = get_session().get(f"{API_BASE_URL}/health", timeout=2)
+        if response.status_code == 200:
+            return True, ""
+        return False, f"Backend error (HTTP {response.status_code})"
+    except Exception:
+        return False, "Backend not accessible"
+
 def main():
     st.title("📞 Cold Call Agent Demo")
     st.markdown("---")
@@ -78,76 +151,35 @@ def main():
         
         if uploaded_file is not None:
             try:
-                # Read CSV with phone column explicitly as string type
-                df = pd.read_csv(uploaded_file, dtype={'phone': str})
-                
-                # Convert all phone numbers to strings if they exist
-                if 'phone' in df.columns:
-                    df['phone'] = df['phone'].astype(str)
-                    
-                    # Format phone numbers properly - strip any non-digit chars except '+'
-                    df['phone'] = df['phone'].apply(lambda x: str(x).strip())
-                    # Add '+' prefix if missing
-                    df['phone'] = df['phone'].apply(lambda x: '+' + x if not x.startswith('+') else x)
+                # Parsed and validated once per file; reruns reuse the cached result
+                df, error, skipped = load_contacts(uploaded_file.getvalue())
                 
-                # Validate required columns
-                required_cols = ['name', 'phone']
-                if not all(col in df.columns for col in required_cols):
-                    st.error("❌ CSV must contain 'name' and 'phone' columns")
+                if error:
+                    st.error(f"❌ {error}")
                 else:
+                    if skipped:
+                        st.warning(f"⚠️ Skipped {skipped} rows without a name or a usable phone number")
+                    
                     # Show preview of data
                     st.subheader("Contact Preview")
-                    st.dataframe(df, hide_index=True)
+                    # Only a bounded slice goes to the browser, whatever the file size
+                    if len(df) > PREVIEW_ROWS:
+                        st.caption(f"{len(df):,} contacts loaded (previewing first {PREVIEW_ROWS})")
+                    else:
+                        st.caption(f"{len(df):,} contacts loaded")
+                    st.dataframe(df.head(PREVIEW_ROWS), hide_index=True)
 
                     # Add call approach options
                     call_approach = st.radio(
                         "Select call approach:",
-                        ["Call selected contacts now"]
+                        ["Call selected contacts now", "Schedule calls for entire list"]
                     )
                     
                     if call_approach == "Call selected contacts now":
                         # Original functionality for immediate calls
-                        # Select which contacts to call
-                        st.subheader("Select Contacts to Call")
-                        
-                        # Option for selecting all
-                        select_all = st.checkbox("Select All Contacts", value=False)
-                        
-                        # If select all is checked, select all contacts
-                        if select_all:
-                            selected_indices = list(range(len(df)))
-                        else:
-                            # Multiselect for individual contacts
-                            options = [f"{row['name']} ({row['phone']})" for _, row in df.iterrows()]
-                            selected_options = st.multiselect("Select contacts to call:", options)
-                            selected_indices = [options.index(option) for option in selected_options]
-                        
-                        # Calculate selection counts
-                        total_contacts = len(df)
-                        selected_count = len(selected_indices)
-                        
-                        # Display selection info
-                        st.text(f"Selected {selected_count} out of {total_contacts} contacts")
-                        
-                        # Make calls to selected contacts
-                        if selected_indices:
-                            if st.button("📞 Call Selected Contacts", type="primary", use_container_width=True):
-                                call_progress = st.progress(0)
-                                status_container = st.container()
-                                
-                                for i, idx in enumerate(selected_indices):
-                                    contact = df.iloc[idx]
-                                    contact_name = contact['name']
-                                    contact_phone = contact['phone']
-                                    
-                                    status_container.text(f"Calling {contact_name} at {contact_phone}...")
-                                    initiate_call(contact_name, contact_phone)
-                                    
-                                    # Update progress
-                                    progress = (i + 1) / len(selected_indices)
-                                    call_progress.progress(progress)
-                                    
-                                status_container.success(f"✅ Completed {selected_count} calls")
+                        # Selection widgets rerun only this fragment, not the whole page
+                        names, phones = contact_lists(uploaded_file.getvalue())
+                        _selection_panel(names, phones)
                     
                     else:  # Schedule calls for entire list
                         st.subheader("Schedule Bulk Calls")
@@ -159,81 +191,318 @@ def main():
                         with col2:
                             scheduled_time = st.time_input("Select Time", datetime.now().time())
                         
-                        # Combine date and time
-                        scheduled_datetime = datetime.combine(scheduled_date, scheduled_time)
+                        # Combine date and time; the pickers are in the Streamlit server's local timezone
+                        scheduled_datetime = datetime.combine(scheduled_date, scheduled_time).astimezone()
                         
                         total_contacts = len(df)
-                        st.text(f"Will schedule calls for all {total_contacts} contacts at {scheduled_datetime}")
+                        st.text(f"Will schedule calls for all {total_contacts} contacts at {scheduled_datetime:%Y-%m-%d %H:%M %Z}")
                         
                         # Schedule calls button
                         if st.button("📅 Schedule All Calls", type="primary", use_container_width=True):
-                            if schedule_bulk_calls(df, scheduled_datetime):
+                            if scheduled_datetime <= datetime.now().astimezone():
+                                st.error("❌ Pick a date and time in the future to schedule calls")
+                            elif schedule_bulk_calls(df, scheduled_datetime):
                                 st.success(f"✅ Successfully scheduled {total_contacts} calls")
             
             except Exception as e:
                 st.error(f"❌ Error processing CSV: {str(e)}")
 
-def initiate_call(user_name: str, phone_number: str):
+@st.fragment
+def _selection_panel(names, phones):
     """
-    Send request to backend to initiate the call
+    Contact selection and dialing; runs as a fragment so its widgets rerun only this panel
     """
-    with st.spinner("🔄 Initiating call..."):
-        try:
-            # Convert phone_number to string to prevent int64 serialization issues
-            if not isinstance(phone_number, str):
-                phone_number = str(phone_number)
+    # Select which contacts to call
+    st.subheader("Select Contacts to Call")
+    
+    # Option for selecting all
+    select_all = st.checkbox("Select All Contacts", value=False)
+    
+    # If select all is checked, select all contacts
+    if select_all:
+        selected_indices = range(len(names))
+    else:
+        # Multiselect over row positions; labels are only used for display
+        labels = [f"{name} ({phone})" for name, phone in zip(names, phones)]
+        selected_indices = st.multiselect(
+            "Select contacts to call:",
+            options=range(len(names)),
+            format_func=labels.__getitem__
+        )
+    
+    # Calculate selection counts
+    total_contacts = len(names)
+    selected_count = len(selected_indices)
+    
+    # Display selection info
+    st.text(f"Selected {selected_count} out of {total_contacts} contacts")
+    
+    # Make calls to selected contacts
+    if selected_count:
+        if st.button("📞 Call Selected Contacts", type="primary", use_container_width=True):
+            # Fail fast on a known-down backend instead of waiting out timeouts
+            backend_ok, backend_detail = _backend_health()
+            if not backend_ok:
+                st.error(f"❌ {backend_detail}. Start the FastAPI server or refresh the status, then try again.")
+                return
             
-            # Ensure phone number has proper format (add + if missing)
-            if phone_number and not phone_number.startswith('+'):
-                phone_number = '+' + phone_number
-                
-            # Prepare request payload
-            payload = {
-                "user_name": user_name,
-                "phone_number": phone_number
-            }
+            call_progress = st.progress(0)
+            status_container = st.container()
+            status_container.text(f"Calling {selected_count} contacts...")
             
-            # Make API request
-            response = requests.post(
-                f"{API_BASE_URL}/initiate_call",
-                json=payload,
-                timeout=30
-            )
+            contacts = [
+                {"user_name": names[i], "phone_number": _format_phone(phones[i])}
+                for i in selected_indices
+            ]
             
-            if response.status_code == 200:
-                result = response.json()
-                st.success(f"✅ Call to {user_name} initiated successfully!")
-                
-                st.info("💡 The agent will now dial the provided number and attempt to make the cold call.")
+            try:
+                # Send the whole selection in one request
+                results = initiate_calls_bulk(contacts)
+                if results is None:
+                    # Backend without the batch endpoint: one request per contact
+                    results = _post_calls_concurrently(contacts)
                 
-            else:
-                error_detail = response.json().get("detail", "Unknown error")
-                st.error(f"❌ Failed to initiate call: {error_detail}")
+                # Each widget update is a browser round-trip: report failures as they
+                # come, but move the progress bar in about 50 steps however many calls
+                step = max(1, len(contacts) // 50)
+                for done, (contact_name, ok, detail) in enumerate(results, start=1):
+                    if not ok:
+                        st.error(f"❌ {contact_name}: {detail}")
+                    
+                    # Update progress
+                    if done % step == 0 or done == len(contacts):
+                        call_progress.progress(done / len(contacts))
                 
-        except requests.exceptions.ConnectionError:
-            st.error("❌ Cannot connect to backend. Make sure the FastAPI server is running on port 8000.")
-        except requests.exceptions.Timeout:
-            st.error("❌ Request timed out. Please try again.")
-        except Exception as e:
-            st.error(f"❌ An error occurred: {str(e)}")
+                status_container.success(f"✅ Completed {selected_count} calls")
+            except requests.exceptions.ConnectionError:
+                st.error("❌ Cannot connect to backend. Make sure the FastAPI server is running on port 8000.")
+            except requests.exceptions.RequestException as e:
+                st.error(f"❌ Bulk call request failed: {str(e)}")
+
+@st.cache_data(show_spinner=False)
+def load_contacts(file_bytes: bytes):
+    """
+    Parse an uploaded contacts CSV, cached by file content so widget reruns skip it.
+    Returns (df, error, skipped); a file missing required columns is cached with its error.
+    Rows without a name or phone number are dropped here, and counted in skipped.
+    """
+    chunks = []
+    skipped = 0
+    # Read CSV in bounded chunks with phone column explicitly as string type
+    # Only the known contact columns are kept, so extra CSV columns never take memory
+    with pd.read_csv(
+        io.BytesIO(file_bytes),
+        dtype={'phone': str},
+        usecols=lambda col: col in CONTACT_COLUMNS,
+        chunksize=CSV_CHUNK_ROWS
+    ) as reader:
+        for chunk in reader:
+            # Validate required columns on the first chunk, before any normalization
+            if not chunks and not all(col in chunk.columns for col in REQUIRED_COLUMNS):
+                return None, "CSV must contain 'name' and 'phone' columns", 0
+            
+            # Normalize phone numbers in one regex pass: keep only the digits, dropping
+            # spaces, dashes, parens and any '+' (read_csv already made them strings)
+            phones = chunk['phone'].mask(
+                chunk['phone'].str.fullmatch(_PHONE_AS_FLOAT, na=False)
+                | chunk['phone'].str.contains(_PHONE_EXTENSION, na=False)
+            )
+            phones = phones.str.replace(_PHONE_TRUNK_ZERO, '', regex=True)
+            # A single '+' prefix goes back in front; empty cells stay missing
+            chunk['phone'] = '+' + phones.str.replace(_PHONE_JUNK, '', regex=True)
+            
+            # A contact that can't be dialed is dropped once, here, so calling and
+            # scheduling never see a blank name or phone
+            usable = chunk['name'].notna() & chunk['phone'].str.contains(r'\d', na=False)
+            skipped += int((~usable).sum())
+            chunks.append(chunk[usable])
+    
+    df = pd.concat(chunks, ignore_index=True, copy=False) if chunks else None
+    if df is None or df.empty:
+        return None, "CSV has no rows with both a name and a phone number", skipped
+    return df, None, skipped
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def contact_lists(file_bytes: bytes):
+    """
+    Name and phone columns of an uploaded CSV as plain lists, extracted once per file.
+    Cached as a resource so reruns share the same read-only lists instead of copies.
+    """
+    df, _, _ = load_contacts(file_bytes)
+    return df['name'].tolist(), df['phone'].tolist()
+
+def initiate_call(user_name: str, phone_number: str):
+    """
+    Send request to backend to initiate the call
+    """
+    with st.spinner("🔄 Initiating call..."):
+        _, ok, detail = _post_call(get_session(), user_name, phone_number)
+
+    if ok:
+        st.success(f"✅ Call to {user_name} initiated successfully!")
+        
+        st.info("💡 The agent will now dial the provided number and attempt to make the cold call.")
+    else:
+        st.error(f"❌ {detail}")
+
+def initiate_calls_bulk(contacts):
+    """
+    Send all contacts to the backend in one request. Returns an iterator of
+    (user_name, ok, detail) as the backend streams each result, or None if the
+    backend has no batch endpoint.
+    """
+    response = get_session().post(
+        f"{API_BASE_URL}/initiate_calls_bulk",
+        data=orjson.dumps({"contacts": contacts}),
+        headers=JSON_HEADERS,
+        stream=True,
+        timeout=BULK_CALL_TIMEOUT
+    )
+    
+    if response.status_code == 200:
+        return _iter_call_results(response)
+    
+    # Only the streaming path closes the response itself; release the connection here
+    with response:
+        if response.status_code == 404:
+            return None
+        raise requests.exceptions.HTTPError(_error_detail(response), response=response)
+
+def _iter_call_results(response):
+    """
+    Parse the NDJSON status lines streamed back by /initiate_calls_bulk
+    """
+    with response:
+        for line in response.iter_lines():
+            if line:
+                result = orjson.loads(line)
+                yield result["user_name"], result["ok"], result.get("detail", "")
+
+def _post_calls_concurrently(contacts):
+    """
+    Fallback for backends without /initiate_calls_bulk: post each contact from
+    worker threads and yield (user_name, ok, detail) as calls finish
+    """
+    session = get_session()
+    with ThreadPoolExecutor(max_workers=BULK_CALL_WORKERS) as pool:
+        futures = [
+            pool.submit(_post_call, session, contact["user_name"], contact["phone_number"])
+            for contact in contacts
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+def _format_phone(phone_number):
+    """
+    Normalize a phone number to a string with a leading '+'
+    """
+    # Convert phone_number to string to prevent int64 serialization issues
+    if not isinstance(phone_number, str):
+        phone_number = str(phone_number)
+    
+    # Ensure phone number has proper format (add + if missing)
+    if phone_number and not phone_number.startswith('+'):
+        phone_number = '+' + phone_number
+    return phone_number
+
+def _error_detail(response):
+    """
+    Extract the error detail from a failed backend response
+    """
+    # Proxies in front of the backend can answer 502/504 with an empty or HTML body
+    data = {}
+    if response.headers.get("content-type", "").startswith("application/json"):
+        data = response.json()
+    detail = data.get("detail")
+    # Request validation errors (422) come back as a list of pydantic errors
+    if isinstance(detail, list):
+        detail = "; ".join(
+            f"{'.'.join(str(part) for part in error.get('loc', []) if part != 'body')}: {error.get('msg')}"
+            for error in detail[:3]
+        ) + (f" (and {len(detail) - 3} more)" if len(detail) > 3 else "")
+    return detail or response.text[:200] or "Unknown error"
+
+def _post_call(session, user_name, phone_number):
+    """
+    Post a single call to the backend and return (user_name, ok, detail).
+    Doesn't touch Streamlit, so it is safe to run from worker threads.
+    """
+    try:
+        # Prepare request payload
+        payload = {
+            "user_name": user_name,
+            "phone_number": _format_phone(phone_number)
+        }
+        
+        # Make API request
+        response = session.post(
+            f"{API_BASE_URL}/initiate_call",
+            data=orjson.dumps(payload),
+            headers=JSON_HEADERS,
+            timeout=CALL_TIMEOUT
+        )
+        
+        if response.status_code == 200:
+            return user_name, True, ""
+        
+        return user_name, False, f"Failed to initiate call: {_error_detail(response)}"
+            
+    except requests.exceptions.ConnectionError:
+        return user_name, False, "Cannot connect to backend. Make sure the FastAPI server is running on port 8000."
+    except requests.exceptions.Timeout:
+        return user_name, False, "Request timed out. Please try again."
+    except Exception as e:
+        return user_name, False, f"An error occurred: {str(e)}"
+
+# Request/response shape of call.py's /schedule_bulk_calls, shown when the backend lacks it
+_BACKEND_CONTRACT = """
+POST /schedule_bulk_calls
+{
+  "contacts": [{"user_name": "...", "phone_number": "+...", "linkedin_url": "... or null"}],
+  "scheduled_at": "2025-01-31T15:00:00+04:00"   # offset required, must be in the future
+}
+-> 200 {"status": "success", "schedule_id": "...", "scheduled_calls": <n>, "scheduled_at": "..."}
+-> 422 for a past or offset-less scheduled_at, or an invalid contact
+"""
 
 def schedule_bulk_calls(df, scheduled_datetime):
     """
-    Store scheduled calls locally in session state since backend endpoint doesn't exist yet
+    Hand the whole schedule to the backend in one request. Falls back to a local
+    session-state schedule if the backend has no scheduling endpoint.
     """
     try:
-        # Initialize scheduled calls in session state if not exists
+        # Get contact information
+        contacts = df[['name', 'phone']].rename(
+            columns={'name': 'user_name', 'phone': 'phone_number'}
+        ).to_dict(orient='records')
+        
+        # Attach LinkedIn profiles when the CSV has them, with blanks as None
+        if 'linkedin_url' in df.columns:
+            linkedin_urls = df['linkedin_url'].astype(object).where(df['linkedin_url'].notna(), None).tolist()
+            for contact, linkedin_url in zip(contacts, linkedin_urls):
+                contact["linkedin_url"] = linkedin_url
+        
+        # The backend owns the fan-out, so scheduling is one round-trip
+        payload = {"contacts": contacts, "scheduled_at": scheduled_datetime.isoformat()}
+        response = get_session().post(
+            f"{API_BASE_URL}/schedule_bulk_calls",
+            data=orjson.dumps(payload),
+            headers=JSON_HEADERS,
+            timeout=(3.05, 20)
+        )
+        
+        if response.status_code == 200:
+            st.info(f"📅 Calls scheduled for {scheduled_datetime.strftime('%Y-%m-%d %H:%M')}")
+            return True
+        
+        if response.status_code != 404:
+            st.error(f"❌ Failed to schedule calls: {_error_detail(response)}")
+            return False
+        
+        # Backend without the scheduling endpoint: keep the schedule locally
         if 'scheduled_calls' not in st.session_state:
             st.session_state.scheduled_calls = []
         
-        # Get contact information
-        contacts = []
-        for _, row in df.iterrows():
-            contacts.append({
-                "user_name": row['name'],
-                "phone_number": row['phone']
-            })
-        
         # Store in session state
         st.session_state.scheduled_calls.append({
             "contacts": contacts,
@@ -243,18 +512,11 @@ def schedule_bulk_calls(df, scheduled_datetime):
         
         # Show scheduled call information
         st.info(f"📅 Calls scheduled for {scheduled_datetime.strftime('%Y-%m-%d %H:%M')}")
-        st.warning("⚠️ Note: This is a local schedule only. Backend implementation for scheduling is required to make actual calls at the scheduled time.")
+        st.warning("⚠️ Note: This is a local schedule only. The running backend has no /schedule_bulk_calls endpoint; restart it from the current call.py to have these calls dialed at the scheduled time.")
         
-        # Create a placeholder for integrating with a real backend
-        st.code("""
-# Backend API endpoint needed (FastAPI example):
-@app.post("/schedule_bulk_calls")
-async def schedule_bulk_calls(request: ScheduleBulkCallsRequest):
-    # Process the scheduling request
-    # Store in database
-    # Set up job scheduler (e.g., Celery, APScheduler)
-    return {"status": "success", "scheduled_calls": len(request.contacts)}
-""", language="python")
+        # What the backend is expected to accept
+        with st.expander("Backend contract", expanded=False):
+            st.code(_BACKEND_CONTRACT, language="text")
         
         return True
         
@@ -276,14 +538,14 @@ with st.sidebar:
     """)
     
     st.header("🛠️ Backend Status")
-    try:
-        health_response = requests.get(f"{API_BASE_URL}/health", timeout=5)
-        if health_response.status_code == 200:
-            st.success("✅ Backend is running")
-        else:
-            st.error("❌ Backend error")
-    except:
-        st.error("❌ Backend not accessible")
+    if st.button("🔄 Refresh status"):
+        _backend_health.clear()
+    
+    backend_ok, backend_detail = _backend_health()
+    if backend_ok:
+        st.success("✅ Backend is running")
+    else:
+        st.error(f"❌ {backend_detail}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,16 +2,16 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from dotenv import load_dotenv
-import json
-import os
 from typing import Any
 
+import orjson
+
 from livekit import rtc, api
 from livekit.agents import (
     AgentSession,
     Agent,
     JobContext,
+    JobProcess,
     function_tool,
     RunContext,
     get_job_context,
@@ -27,13 +27,12 @@ from livekit.plugins import (
     noise_cancellation, 
 )
 
+from config import settings
 
-# Load environment variables
-load_dotenv(dotenv_path=".env")
 logger = logging.getLogger("outbound-caller")
 logger.setLevel(logging.INFO)
 
-outbound_trunk_id = os.getenv("SIP_OUTBOUND_TRUNK_ID")
+outbound_trunk_id = settings.sip_outbound_trunk_id
 
 
 class OutboundCaller(Agent):
@@ -123,13 +122,18 @@ class OutboundCaller(Agent):
         await self.hangup()
 
 
+def prewarm(proc: JobProcess):
+    """Load the VAD model once per worker process instead of on every call"""
+    proc.userdata["vad"] = silero.VAD.load()
+
+
 async def entrypoint(ctx: JobContext):
     logger.info(f"connecting to room {ctx.room.name}")
     await ctx.connect()
 
     # Parse metadata from the job
     try:
-        metadata = json.loads(ctx.job.metadata)
+        metadata = orjson.loads(ctx.job.metadata)
         logger.info(f"Received metadata: {metadata}")
     except Exception as e:
         logger.error(f"Failed to parse metadata: {e}")
@@ -183,7 +187,7 @@ async def entrypoint(ctx: JobContext):
 
     llm_instance = google.LLM(
         model="gemini-2.0-flash-001",
-        api_key=os.getenv("GOOGLE_API_KEY"),
+        api_key=settings.google_api_key,
         temperature=0.7,  # Balanced creativity
         max_output_tokens=128,  # Limit token count for concise responses
         presence_penalty=0.5,  # Penalize repetition
@@ -192,7 +196,7 @@ async def entrypoint(ctx: JobContext):
 
     # Configure the agent session with AI models
     session = AgentSession(
-        vad=silero.VAD.load(),
+        vad=ctx.proc.userdata["vad"],
         stt=stt_instance,
         tts=tts_instance,
         llm=llm_instance,
@@ -240,13 +244,22 @@ async def entrypoint(ctx: JobContext):
             instructions=f"Hello {customer_name}, this is a representative from {business_name}. Are you available to talk for a few minutes?"
         )
 
-        while True:
-            call_status = participant.attributes.get("sip.callStatus")
-            if call_status == "hangup":
-                logger.info("User hung up the call.")
-                await agent.hangup()
-                break
-            await asyncio.sleep(0.5)
+        # Wait for the SIP hangup attribute instead of polling for it
+        hangup_event = asyncio.Event()
+
+        def on_attributes_changed(changed: dict[str, str], p: rtc.Participant):
+            if p.identity == participant.identity and p.attributes.get("sip.callStatus") == "hangup":
+                hangup_event.set()
+
+        ctx.room.on("participant_attributes_changed", on_attributes_changed)
+        # The call may have ended before the handler was registered
+        if participant.attributes.get("sip.callStatus") == "hangup":
+            hangup_event.set()
+
+        await hangup_event.wait()
+        ctx.room.off("participant_attributes_changed", on_attributes_changed)
+        logger.info("User hung up the call.")
+        await agent.hangup()
 
     except api.TwirpError as e:
         logger.error(
@@ -264,6 +277,7 @@ if __name__ == "__main__":
     cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint,
+            prewarm_fnc=prewarm,
             agent_name="outbound_cold_caller",
         )
     )
\ No newline at end of file